@@ -6,10 +6,10 @@ This hook runs on the Stop event to ingest Claude Code conversation data
 into the Rewind API/Neo4j database.
 
 Features:
-- Pure Python 3 stdlib (no external dependencies)
+- Pure Python 3 stdlib (no external dependencies; uses orjson if installed)
 - State tracking to avoid duplicate message ingestion
-- Incremental processing (only new lines since last run)
-- Never blocks Claude Code (returns 0 on any error)
+- Incremental processing (only new bytes since last run)
+- Never blocks Claude Code (ingests in a detached process, returns 0 on any error)
 - Captures VM/user metadata for enterprise analytics
 
 Environment Variables:
@@ -22,15 +22,27 @@ Environment Variables:
 """
 
 import json
+import logging
 import os
 import socket
 import subprocess
 import sys
 import urllib.request
 import urllib.error
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configuration
 API_URL = os.environ.get("REWIND_API_URL", "http://localhost:8429")
@@ -45,24 +57,86 @@ ENVIRONMENT = os.environ.get("REWIND_ENVIRONMENT")
 # State file location
 STATE_DIR = Path.home() / ".claude" / "state" / "rewind"
 STATE_FILE = STATE_DIR / "state.json"
+LOCK_FILE = STATE_DIR / "state.lock"
 LOG_FILE = STATE_DIR / "hook.log"
 
+# Command-line flag marking the detached process that performs ingestion
+BACKGROUND_FLAG = "--background"
 
-def log(message: str, level: str = "INFO") -> None:
-    """Log message to file."""
-    try:
+# Transcript entry types that represent conversation messages
+VALID_MESSAGE_TYPES = frozenset({"user", "assistant"})
+
+
+def json_loads(data: bytes | str) -> Any:
+    """Parse JSON, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps_bytes(obj: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+logger = logging.getLogger(__name__)
+
+# Set once STATE_DIR is known to exist, so later calls skip the mkdir syscall
+_state_dir_ready = False
+
+
+def ensure_state_dir() -> None:
+    """Create STATE_DIR on first use."""
+    global _state_dir_ready
+    if not _state_dir_ready:
         STATE_DIR.mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().isoformat()
-        with open(LOG_FILE, "a") as f:
-            f.write(f"[{timestamp}] [{level}] {message}\n")
-    except Exception:
+        _state_dir_ready = True
+
+
+class _QuietFileHandler(logging.FileHandler):
+    """File handler that drops records it cannot write."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # The delayed open happens outside FileHandler's own error handling
+        try:
+            super().emit(record)
+        except Exception:
+            pass  # Never fail on logging
+
+    def handleError(self, record: logging.LogRecord) -> None:
         pass  # Never fail on logging
 
 
+def _configure_logging() -> None:
+    """Attach a single file handler; the log file is opened on first write."""
+    logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+    logger.propagate = False
+    try:
+        ensure_state_dir()
+        handler = _QuietFileHandler(LOG_FILE, delay=True)
+    except Exception:
+        logger.addHandler(logging.NullHandler())
+        return
+    handler.setFormatter(logging.Formatter(
+        "[%(asctime)s.%(msecs)03d] [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S",
+    ))
+    logger.addHandler(handler)
+
+
+_configure_logging()
+
+
+def log(message: str, level: str = "INFO") -> None:
+    """Log message to file."""
+    logger.log(logging.getLevelName(level), message)
+
+
 def debug(message: str) -> None:
     """Log debug message if debug mode is enabled."""
-    if DEBUG:
-        log(message, "DEBUG")
+    logger.debug(message)
 
 
 def get_ip_address() -> str | None:
@@ -163,6 +237,32 @@ def collect_metadata() -> dict[str, Any]:
     return {k: v for k, v in metadata.items() if v is not None}
 
 
+@contextmanager
+def state_lock(blocking: bool = True) -> Iterator[bool]:
+    """Hold an exclusive lock on the state for the duration of the block.
+
+    Locks a separate file so concurrent hooks never race on creating or
+    replacing state.json itself. Yields whether the lock was acquired, which
+    is always the case when blocking.
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    ensure_state_dir()
+    with open(LOCK_FILE, "a") as lock_file:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
 def load_state() -> dict[str, Any]:
     """Load state from file."""
     try:
@@ -171,63 +271,87 @@ def load_state() -> dict[str, Any]:
                 return json.load(f)
     except Exception as e:
         debug(f"Failed to load state: {e}")
-    return {"processed_lines": {}}
+    return {"processed_offsets": {}}
 
 
 def save_state(state: dict[str, Any]) -> None:
-    """Save state to file."""
+    """Save state to file atomically via a temp file and rename."""
     try:
-        STATE_DIR.mkdir(parents=True, exist_ok=True)
-        with open(STATE_FILE, "w") as f:
+        ensure_state_dir()
+        tmp_file = STATE_FILE.with_suffix(".json.tmp")
+        with open(tmp_file, "w") as f:
             json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, STATE_FILE)
     except Exception as e:
         debug(f"Failed to save state: {e}")
 
 
-def read_transcript(transcript_path: str, start_line: int = 0) -> list[dict[str, Any]]:
-    """Read transcript JSONL file from given line number."""
+def read_transcript(
+    transcript_path: str, start_offset: int = 0
+) -> tuple[list[dict[str, Any]], int]:
+    """Read valid conversation messages from given byte offset.
+
+    Returns the parsed messages and the offset just past the last complete
+    line. A trailing line without a newline is still being written, so it is
+    left for the next run.
+    """
     messages = []
+    offset = start_offset
     try:
-        with open(transcript_path) as f:
-            for i, line in enumerate(f):
-                if i < start_line:
-                    continue
+        with open(transcript_path, "rb") as f:
+            f.seek(start_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                line_offset = offset
+                offset += len(line)
                 line = line.strip()
                 if not line:
                     continue
                 try:
-                    msg = json.loads(line)
-                    messages.append(msg)
+                    msg = json_loads(line)
                 except json.JSONDecodeError as e:
-                    debug(f"Failed to parse line {i}: {e}")
+                    debug(f"Failed to parse line at offset {line_offset}: {e}")
+                    continue
+                # Keep only conversation messages with the required fields
+                if (
+                    msg.get("type") in VALID_MESSAGE_TYPES
+                    and msg.get("uuid")
+                    and msg.get("sessionId")
+                    and msg.get("message")
+                ):
+                    messages.append(msg)
     except Exception as e:
         log(f"Failed to read transcript: {e}", "ERROR")
-    return messages
+    return messages, offset
 
 
-def filter_messages(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    """Filter for valid conversation messages."""
-    valid_types = {"user", "assistant"}
-    filtered = []
-    for msg in messages:
-        msg_type = msg.get("type")
-        if msg_type in valid_types:
-            # Ensure required fields exist
-            if msg.get("uuid") and msg.get("sessionId") and msg.get("message"):
-                filtered.append(msg)
-    return filtered
-
-
-def extract_project_info(messages: list[dict[str, Any]], cwd: str) -> tuple[str, str]:
-    """Extract project ID and path from messages or cwd."""
-    # Try to get cwd from first message, fall back to provided cwd
-    project_path = cwd
+def offset_after_lines(transcript_path: str, line_count: int) -> int:
+    """Convert a legacy processed line count into a byte offset."""
+    offset = 0
+    try:
+        with open(transcript_path, "rb") as f:
+            for i, line in enumerate(f):
+                if i >= line_count:
+                    break
+                offset += len(line)
+    except Exception as e:
+        debug(f"Failed to convert line count to offset: {e}")
+    return offset
+
+
+def find_message_cwd(messages: list[dict[str, Any]]) -> str | None:
+    """Return the cwd recorded on the first message that has one."""
     for msg in messages:
         if msg.get("cwd"):
-            project_path = msg["cwd"]
-            break
+            return msg["cwd"]
+    return None
 
-    # Generate project ID from path
+
+def project_id_from_path(project_path: str) -> str:
+    """Generate a project ID from a project path."""
     project_id = project_path.replace("/", "-").strip("-")
     if project_id.startswith("home-"):
         # Shorten home directory paths
@@ -235,7 +359,7 @@ def extract_project_info(messages: list[dict[str, Any]], cwd: str) -> tuple[str,
         if len(parts) > 2:
             project_id = "-".join(parts[2:])
 
-    return project_id, project_path
+    return project_id
 
 
 def send_to_api(
@@ -262,7 +386,7 @@ def send_to_api(
         payload["metadata"] = metadata
 
     try:
-        data = json.dumps(payload).encode("utf-8")
+        data = json_dumps_bytes(payload)
         url = f"{API_URL}/api/ingest/batch"
         req = urllib.request.Request(
             url, data=data, headers={"Content-Type": "application/json"}, method="POST"
@@ -270,7 +394,7 @@ def send_to_api(
 
         debug(f"Sending {len(messages)} messages to {url}")
         with urllib.request.urlopen(req, timeout=30) as response:
-            result = json.loads(response.read().decode("utf-8"))
+            result = json_loads(response.read())
             debug(f"API response: {result}")
             return result.get("success", False)
 
@@ -282,13 +406,135 @@ def send_to_api(
         return False
 
 
-def count_lines(filepath: str) -> int:
-    """Count total lines in a file."""
+def has_new_transcript_data(hook_input: dict[str, Any]) -> bool:
+    """Cheap, lock-free check for transcript bytes that have not been ingested.
+
+    The state read may be stale; ingest() re-checks under the state lock.
+    """
+    transcript_path = hook_input.get("transcript_path")
+    if not transcript_path or not hook_input.get("session_id"):
+        debug("Missing transcript_path or session_id")
+        return False
+
+    transcript_path = os.path.expanduser(transcript_path)
     try:
-        with open(filepath) as f:
-            return sum(1 for _ in f)
-    except Exception:
-        return 0
+        transcript_size = os.stat(transcript_path).st_size
+    except FileNotFoundError:
+        debug(f"Transcript file not found: {transcript_path}")
+        return False
+
+    processed_offset = load_state().get("processed_offsets", {}).get(transcript_path)
+    if processed_offset is not None and transcript_size <= processed_offset:
+        debug(f"No new bytes to process (size: {transcript_size}, processed: {processed_offset})")
+        return False
+    return True
+
+
+def ingest(hook_input: dict[str, Any]) -> None:
+    """Ingest new transcript messages described by the hook input."""
+    debug(f"Hook input: {json.dumps(hook_input, indent=2)}")
+
+    # Extract required fields
+    transcript_path = hook_input.get("transcript_path")
+    session_id = hook_input.get("session_id")
+    cwd = hook_input.get("cwd", "")
+
+    if not transcript_path or not session_id:
+        debug("Missing transcript_path or session_id")
+        return
+
+    # Expand ~ in path
+    transcript_path = os.path.expanduser(transcript_path)
+
+    try:
+        transcript_size = os.stat(transcript_path).st_size
+    except FileNotFoundError:
+        debug(f"Transcript file not found: {transcript_path}")
+        return
+
+    # Load state and get last processed offset
+    state = load_state()
+    processed_offsets = state.get("processed_offsets", {})
+    start_offset = processed_offsets.get(transcript_path)
+    if start_offset is None:
+        # Migrate from state written by older versions, which tracked lines
+        legacy_lines = state.get("processed_lines", {}).pop(transcript_path, 0)
+        start_offset = offset_after_lines(transcript_path, legacy_lines)
+
+    # Skip opening the transcript when nothing has been appended
+    if transcript_size <= start_offset:
+        debug(f"No new bytes to process (size: {transcript_size}, processed: {start_offset})")
+        return
+
+    # Read new valid messages and the offset reached in one pass
+    filtered_messages, end_offset = read_transcript(transcript_path, start_offset)
+    if end_offset <= start_offset:
+        debug(f"No new bytes to process (end: {end_offset}, processed: {start_offset})")
+        return
+
+    debug(f"Processing bytes {start_offset} to {end_offset} from {transcript_path}")
+
+    if not filtered_messages:
+        debug("No valid messages to ingest")
+        # Still update state to skip these lines next time
+        processed_offsets[transcript_path] = end_offset
+        state["processed_offsets"] = processed_offsets
+        save_state(state)
+        return
+
+    # Extract project info, reusing the result from earlier runs
+    projects = state.setdefault("projects", {})
+    cached_project = projects.get(transcript_path)
+    if cached_project:
+        project_id, project_path = cached_project["id"], cached_project["path"]
+    else:
+        # Prefer the cwd recorded in the transcript over the hook's cwd
+        message_cwd = find_message_cwd(filtered_messages)
+        project_path = message_cwd or cwd
+        project_id = project_id_from_path(project_path)
+        # Only cache a path taken from the transcript, so a fallback never
+        # sticks once later batches carry a real cwd
+        if message_cwd:
+            projects[transcript_path] = {"id": project_id, "path": project_path}
+    debug(f"Project: {project_id} at {project_path}")
+
+    # Collect VM/user metadata for enterprise analytics
+    metadata = collect_metadata()
+    debug(f"Metadata: {json.dumps(metadata)}")
+
+    # Send to API
+    success = send_to_api(project_id, project_path, session_id, filtered_messages, metadata)
+
+    if success:
+        log(f"Ingested {len(filtered_messages)} messages for session {session_id}")
+        # Update state with new offset
+        processed_offsets[transcript_path] = end_offset
+        state["processed_offsets"] = processed_offsets
+        save_state(state)
+    else:
+        log(f"Failed to ingest messages for session {session_id}", "ERROR")
+
+
+def spawn_background_ingest(input_data: str) -> bool:
+    """Hand the hook input to a detached copy of this script.
+
+    The API request can take a while, so ingestion runs in its own session
+    and Claude Code is not kept waiting on it.
+    """
+    try:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), BACKGROUND_FLAG],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        process.stdin.write(input_data.encode("utf-8"))
+        process.stdin.close()
+        return True
+    except Exception as e:
+        log(f"Failed to start background ingest: {e}", "ERROR")
+        return False
 
 
 def main() -> int:
@@ -306,69 +552,26 @@ def main() -> int:
             return 0
 
         hook_input = json.loads(input_data)
-        debug(f"Hook input: {json.dumps(hook_input, indent=2)}")
-
-        # Extract required fields
-        transcript_path = hook_input.get("transcript_path")
-        session_id = hook_input.get("session_id")
-        cwd = hook_input.get("cwd", "")
-
-        if not transcript_path or not session_id:
-            debug("Missing transcript_path or session_id")
-            return 0
-
-        # Expand ~ in path
-        transcript_path = os.path.expanduser(transcript_path)
-
-        if not os.path.exists(transcript_path):
-            debug(f"Transcript file not found: {transcript_path}")
-            return 0
-
-        # Load state and get last processed line
-        state = load_state()
-        processed_lines = state.get("processed_lines", {})
-        start_line = processed_lines.get(transcript_path, 0)
-
-        # Get current line count
-        total_lines = count_lines(transcript_path)
-        if total_lines <= start_line:
-            debug(f"No new lines to process (total: {total_lines}, processed: {start_line})")
-            return 0
-
-        debug(f"Processing lines {start_line} to {total_lines} from {transcript_path}")
-
-        # Read and filter new messages
-        new_messages = read_transcript(transcript_path, start_line)
-        filtered_messages = filter_messages(new_messages)
-
-        if not filtered_messages:
-            debug("No valid messages to ingest")
-            # Still update state to skip these lines next time
-            processed_lines[transcript_path] = total_lines
-            state["processed_lines"] = processed_lines
-            save_state(state)
-            return 0
-
-        # Extract project info
-        project_id, project_path = extract_project_info(filtered_messages, cwd)
-        debug(f"Project: {project_id} at {project_path}")
-
-        # Collect VM/user metadata for enterprise analytics
-        metadata = collect_metadata()
-        debug(f"Metadata: {json.dumps(metadata)}")
-
-        # Send to API
-        success = send_to_api(project_id, project_path, session_id, filtered_messages, metadata)
-
-        if success:
-            log(f"Ingested {len(filtered_messages)} messages for session {session_id}")
-            # Update state with new line count
-            processed_lines[transcript_path] = total_lines
-            state["processed_lines"] = processed_lines
-            save_state(state)
-        else:
-            log(f"Failed to ingest messages for session {session_id}", "ERROR")
 
+        # Detach unless we are already the background process, and only when
+        # there is something to ingest; fall back to ingesting inline if the
+        # process cannot be started
+        is_background = BACKGROUND_FLAG in sys.argv[1:]
+        if not is_background:
+            if not has_new_transcript_data(hook_input):
+                return 0
+            if spawn_background_ingest(input_data):
+                debug("Started background ingest")
+                return 0
+
+        # Serialize the state read-modify-write across concurrent hooks. A
+        # background ingest never queues behind another one: the bytes stay
+        # unprocessed and the next Stop event picks them up.
+        with state_lock(blocking=not is_background) as acquired:
+            if not acquired:
+                debug("Another ingest is running; leaving new bytes for the next run")
+                return 0
+            ingest(hook_input)
         return 0
 
     except json.JSONDecodeError as e:
@@ -28,6 +28,19 @@ BLOCKED_PATTERNS = [
     (r'>\([^)]+\)', 'Process substitution >() is not allowed.'),
 ]
 
+# All patterns unioned into one regex so each command is scanned once;
+# the named group that matched identifies the reason. The chaining patterns
+# depend on lookbehind/lookahead, which DFA engines such as Hyperscan do not
+# support, so matching stays on the stdlib `re` module.
+_COMBINED = re.compile('|'.join(
+    f'(?P<g{i}>{pattern})' for i, (pattern, _) in enumerate(BLOCKED_PATTERNS)
+))
+_REASONS = {f'g{i}': message for i, (_, message) in enumerate(BLOCKED_PATTERNS)}
+
+# Every blocked pattern contains at least one of these characters, so
+# commands without any of them can skip the regex entirely.
+_TRIGGER_CHARS = '&|;$`<>'
+
 # Commands that are allowed to use piping (read-only/safe operations)
 PIPE_ALLOWED_PREFIXES = [
     'grep',
@@ -55,9 +68,12 @@ def validate_command(command: str) -> tuple[bool, str]:
     Returns:
         (is_blocked, reason) - True if command should be blocked
     """
-    for pattern, message in BLOCKED_PATTERNS:
-        if re.search(pattern, command):
-            return True, message
+    if not any(c in command for c in _TRIGGER_CHARS):
+        return False, ""
+
+    match = _COMBINED.search(command)
+    if match:
+        return True, _REASONS[match.lastgroup]
 
     return False, ""
 
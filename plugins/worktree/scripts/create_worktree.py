@@ -6,16 +6,47 @@ Creates a new Git worktree in a standardized location with proper structure.
 Usage: python create_worktree.py <branch-name>
 """
 
+import os
+import re
 import sys
+import secrets
+import time
+import functools
 import logging
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import NoReturn
+from typing import Iterator, NamedTuple, NoReturn
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None  # Windows only
 
 
 logger = logging.getLogger(__name__)
 
+LOCK_FILE_NAME = 'worktree-create.lock'
+# Waiters must outlast a holder that is itself retrying git (see
+# GIT_RETRY_*), so the wait budget is well above that worst case.
+LOCK_TIMEOUT = 30.0
+LOCK_BASE_DELAY = 0.5
+LOCK_MAX_DELAY = 2.0
+
+GIT_RETRY_ATTEMPTS = 3
+GIT_RETRY_BASE_DELAY = 0.5
+TRANSIENT_GIT_ERROR = re.compile(r'could not lock config file|File exists|index\.lock')
+
+# Linux ioctl that shares a file's extents copy-on-write (btrfs, XFS, ...).
+FICLONE = 0x40049409
+
 
 class GitOperationError(Exception):
     """Raised when a git operation fails."""
@@ -27,30 +58,116 @@ class WorktreeCreationError(Exception):
     pass
 
 
+class RepoInfo(NamedTuple):
+    """Repository paths resolved from a single `git rev-parse` call."""
+    toplevel: Path
+    git_dir: Path
+    git_common_dir: Path
+    is_inside_work_tree: bool
+
+
 def _execute_git_command(*args: str) -> str:
     """Execute a git command and return stdout."""
     result = subprocess.run(
         ['git', *args],
         capture_output=True,
         text=True,
+        encoding='utf-8',
         check=True
     )
     return result.stdout.strip()
 
 
-def _get_git_toplevel() -> Path:
+@functools.lru_cache(maxsize=1)
+def _get_repo_info() -> RepoInfo:
     try:
-        return Path(_execute_git_command('rev-parse', '--show-toplevel'))
+        output = _execute_git_command(
+            'rev-parse', '--show-toplevel', '--git-dir', '--git-common-dir',
+            '--is-inside-work-tree'
+        )
     except subprocess.CalledProcessError as e:
         raise GitOperationError("Not in a git repository") from e
 
+    toplevel, git_dir, git_common_dir, inside_work_tree = output.split('\n')
+    return RepoInfo(
+        toplevel=Path(toplevel),
+        git_dir=Path(git_dir).resolve(),
+        git_common_dir=Path(git_common_dir).resolve(),
+        is_inside_work_tree=inside_work_tree == 'true',
+    )
+
 
 def get_repo_name() -> str:
-    return _get_git_toplevel().name
+    return _get_repo_info().toplevel.name
 
 
 def get_repo_root() -> Path:
-    return _get_git_toplevel()
+    return _get_repo_info().toplevel
+
+
+def _run_git_with_retry(*args: str) -> str:
+    """Run a git command, retrying when it fails on transient lock contention."""
+    for attempt in range(GIT_RETRY_ATTEMPTS - 1):
+        try:
+            return _execute_git_command(*args)
+        except subprocess.CalledProcessError as e:
+            if not TRANSIENT_GIT_ERROR.search(e.stderr):
+                raise
+            logger.debug("Retrying git %s after lock contention: %s", args[0], e.stderr.strip())
+            time.sleep(GIT_RETRY_BASE_DELAY * 2 ** attempt)
+    return _execute_git_command(*args)
+
+
+def _try_lock(fd: int) -> bool:
+    """Take a non-blocking exclusive lock on fd; False if another process holds it."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def _worktree_lock(git_common_dir: Path) -> Iterator[None]:
+    """Serialize worktree registration across concurrent invocations.
+
+    Locks a file in the shared git directory so that worktrees created from
+    the main checkout or from other worktrees contend on the same lock. The
+    lock is held by the kernel, so it is released even if the holder is
+    killed and never needs to be broken by hand.
+    """
+    lock_path = git_common_dir / LOCK_FILE_NAME
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        delay = LOCK_BASE_DELAY
+        while not _try_lock(fd):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise WorktreeCreationError(
+                    f"Timed out waiting for another worktree creation to finish "
+                    f"(lock: {lock_path})"
+                )
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, LOCK_MAX_DELAY)
+
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
 
 
 def create_worktrees_directory(repo_root: Path, repo_name: str) -> Path:
@@ -59,26 +176,75 @@ def create_worktrees_directory(repo_root: Path, repo_name: str) -> Path:
     return worktrees_dir
 
 
-def create_worktree(worktrees_dir: Path, branch_name: str) -> Path:
-    worktree_path = worktrees_dir / branch_name
+def _claim_worktree_path(worktrees_dir: Path, branch_name: str) -> Path:
+    """Atomically reserve a uniquely suffixed directory for a new worktree."""
+    base_path = worktrees_dir / branch_name
+    base_path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        worktree_path = base_path.with_name(f"{base_path.name}-{secrets.token_hex(3)}")
+        try:
+            os.mkdir(worktree_path)
+            return worktree_path
+        except FileExistsError:
+            continue
+
 
-    if worktree_path.exists():
-        raise WorktreeCreationError(f"Worktree already exists at {worktree_path}")
+def _release_worktree_path(worktree_path: Path) -> None:
+    """Remove a claimed worktree directory if git never populated it."""
+    try:
+        worktree_path.rmdir()
+    except OSError:
+        pass  # Missing, or git already wrote into it
+
+
+def create_worktree(worktrees_dir: Path, branch_name: str) -> Path:
+    # git accepts an existing empty directory as the worktree target.
+    worktree_path = _claim_worktree_path(worktrees_dir, branch_name)
 
     try:
+        # Only registration touches shared state in .git; populate the
+        # working tree after the lock is released. A forced checkout (unlike
+        # `reset --hard`) still runs the repository's post-checkout hook.
+        with _worktree_lock(_get_repo_info().git_common_dir):
+            _run_git_with_retry(
+                'worktree', 'add', '--no-checkout', '-b', branch_name, str(worktree_path)
+            )
         subprocess.run(
-            ['git', 'worktree', 'add', '-b', branch_name, str(worktree_path)],
+            ['git', '-C', str(worktree_path), 'checkout', '--force', '--quiet', branch_name],
             check=True,
-            capture_output=True
+            capture_output=True,
+            text=True,
+            encoding='utf-8'
         )
         logger.info("Created worktree at: %s", worktree_path)
         logger.info("Created branch: %s", branch_name)
     except subprocess.CalledProcessError as e:
-        raise WorktreeCreationError(f"Failed to create worktree: {e.stderr.decode()}") from e
+        _release_worktree_path(worktree_path)
+        raise WorktreeCreationError(f"Failed to create worktree: {e.stderr}") from e
+    except BaseException:
+        _release_worktree_path(worktree_path)
+        raise
 
     return worktree_path
 
 
+def _clone_or_copy(source: str | Path, dest: str | Path) -> None:
+    """Reflink source to dest where supported, otherwise make a real copy.
+
+    A reflink shares data blocks until either side is written, so the copy
+    costs no I/O yet stays fully independent of the original.
+    """
+    if fcntl is not None and sys.platform == 'linux':
+        try:
+            with open(source, 'rb') as src, open(dest, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, dest)
+            return
+        except OSError:
+            pass  # Filesystem without reflinks, or across devices
+    shutil.copy2(source, dest)
+
+
 def _copy_file_if_exists(source: Path, dest: Path) -> bool:
     if source.exists():
         shutil.copy2(source, dest)
@@ -90,7 +256,7 @@ def _copy_directory_if_exists(source: Path, dest: Path) -> bool:
     if source.exists():
         if dest.exists():
             shutil.rmtree(dest)
-        shutil.copytree(source, dest)
+        shutil.copytree(source, dest, copy_function=_clone_or_copy)
         return True
     return False
 
@@ -99,13 +265,28 @@ def copy_untracked_artifacts(repo_root: Path, worktree_path: Path) -> None:
     env_files = ('.env', '.env.local', '.env.development', '.env.production')
     config_directories = ('.claude',)
 
-    for file_name in env_files:
-        if _copy_file_if_exists(repo_root / file_name, worktree_path / file_name):
-            logger.info("Copied %s", file_name)
-
-    for dir_name in config_directories:
-        if _copy_directory_if_exists(repo_root / dir_name, worktree_path / dir_name):
-            logger.info("Copied %s/", dir_name)
+    with ThreadPoolExecutor(max_workers=len(env_files) + len(config_directories)) as executor:
+        file_copies = [
+            (file_name, executor.submit(
+                _copy_file_if_exists, repo_root / file_name, worktree_path / file_name
+            ))
+            for file_name in env_files
+        ]
+        directory_copies = [
+            (dir_name, executor.submit(
+                _copy_directory_if_exists, repo_root / dir_name, worktree_path / dir_name
+            ))
+            for dir_name in config_directories
+        ]
+
+        # Report in submission order so output stays deterministic.
+        for file_name, future in file_copies:
+            if future.result():
+                logger.info("Copied %s", file_name)
+
+        for dir_name, future in directory_copies:
+            if future.result():
+                logger.info("Copied %s/", dir_name)
 
 
 def validate_branch_name(branch_name: str) -> None:
@@ -113,7 +294,7 @@ def validate_branch_name(branch_name: str) -> None:
         raise ValueError("Invalid branch name")
 
 
-def log_usage_instructions(worktree_path: Path, branch_name: str) -> None:
+def log_usage_instructions(worktree_path: Path) -> None:
     separator = "=" * 50
     message = f"""
 {separator}
@@ -127,7 +308,7 @@ Or open in your editor:
   code {worktree_path}
 
 To remove this worktree later:
-  git worktree remove {branch_name}
+  git worktree remove {worktree_path}
 """
     logger.info(message)
 
@@ -162,7 +343,7 @@ def main() -> None:
         logger.info("-" * 50)
 
         repo_root = get_repo_root()
-        repo_name = get_repo_name()
+        repo_name = repo_root.name
 
         logger.info("Repository: %s", repo_name)
         logger.info("Root path: %s", repo_root)
@@ -175,7 +356,7 @@ def main() -> None:
         logger.info("\nCopying important files...")
         copy_untracked_artifacts(repo_root, worktree_path)
 
-        log_usage_instructions(worktree_path, branch_name)
+        log_usage_instructions(worktree_path)
 
     except (ValueError, GitOperationError, WorktreeCreationError) as e:
         exit_with_error(str(e))